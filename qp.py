@@ -1,43 +1,710 @@
-import streamlit as st
-import os
-from google import generativeai as genai
-import pathlib
-from dotenv import load_dotenv
-
-# Load API key from environment variables or Streamlit secrets
-load_dotenv()
-api_key = os.getenv("GOOGLE_API_KEY", st.secrets["API_KEY"] if "API_KEY" in st.secrets else None)
-
-if not api_key:
-    st.error("API Key not found. Please set it in environment variables or Streamlit secrets.")
-else:
-    genai.configure(api_key=api_key)
-
-    st.title("DYNO AI Question Paper Solver")
-    st.write("Upload a PDF question paper, and the AI wextract text")
-
-    uploaded_file = st.file_uploader("Choose a PDF file", type=["pdf"])
-
-    if uploaded_file is not None:
-        with open("temp.pdf", "wb") as f:
-            f.write(uploaded_file.read())
-        
-        filepath = pathlib.Path("temp.pdf")
-
-        prompt = """NO NEED TO SOLVE THE QUESTION JUST GIVE THE EXTRACTED text FROM file
-NO SOLUTION JUST THE text
-JUST JIVE THE TEXT FROM THE file IN A USER READABLE FORMAT
-you mayget some picture related question try you best to give those in best format by using arrow circle if you can this you might get in automata and formala language or dbmse"""
-
-        with st.spinner("Processing your document..."):
-            # Upload the PDF file to Gemini API
-            uploaded_file = genai.upload_file("temp.pdf")
-            
-            # Generate response
-            model = genai.GenerativeModel("gemini-2.0-flash")
-            response = model.generate_content(
-                [uploaded_file, prompt]
-            )
-
-        st.subheader("AI-Generated Solution:")
-        st.write(response.text)
+import streamlit as st
+import asyncio
+import hashlib
+import io
+import os
+import pickle
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from google import generativeai as genai
+import numpy as np
+import pathlib
+from dotenv import load_dotenv
+from google.api_core import exceptions as google_exceptions
+from pypdf import PdfReader, PdfWriter
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+
+try:
+    import pikepdf
+except ImportError:
+    pikepdf = None
+
+PROMPTS = {
+    "extract": """NO NEED TO SOLVE THE QUESTION JUST GIVE THE EXTRACTED text FROM file
+NO SOLUTION JUST THE text
+JUST JIVE THE TEXT FROM THE file IN A USER READABLE FORMAT
+you mayget some picture related question try you best to give those in best format by using arrow circle if you can this you might get in automata and formala language or dbmse""",
+    "solve": """Solve every question in the uploaded question paper.
+Number each answer to match its question and show the working where relevant.
+For diagram questions (automata, formal languages, DBMS) describe the diagram
+with arrows and circles in text as best you can.""",
+}
+
+# Tier policy: short and mid-size papers are routed to the fast/cheap model,
+# only very long ones straight to pro; the cascade still escalates weak flash
+# answers after the fact. The routing threshold sits well above CHUNK_PAGES so
+# chunked papers normally run on flash and the cascade stays reachable.
+DEFAULT_MODEL = "gemini-2.0-flash"
+ESCALATION_MODEL = "gemini-1.5-pro-latest"
+ROUTE_PAGES_THRESHOLD = 20
+MIN_ANSWER_CHARS = 100
+
+# Stay under Gemini's per-minute request quota when firing calls in parallel.
+MAX_CONCURRENT_REQUESTS = 5
+
+# Papers longer than this are split into sub-PDFs solved independently, so the
+# model attends over one chunk at a time instead of the whole document per answer.
+CHUNK_PAGES = 5
+
+# Retry transient failures — rate limits (429) and server-side 5xx — with
+# exponential backoff instead of surfacing a raw exception (which would waste
+# the upload already paid for and make the user re-submit by hand).
+TRANSIENT_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.GatewayTimeout,
+)
+
+retry_on_transient = retry(
+    wait=wait_random_exponential(multiplier=1, max=30),
+    retry=retry_if_exception_type(TRANSIENT_ERRORS),
+    stop=stop_after_attempt(6),
+    reraise=True,
+)
+
+
+@retry_on_transient
+def _upload(pdf_bytes: bytes):
+    try:
+        # mime_type comes from the uploader's type filter, so the SDK never
+        # has to sniff the content; resumable=False skips the chunked-upload
+        # handshake, which typical paper sizes do not need.
+        return genai.upload_file(
+            path=io.BytesIO(pdf_bytes), mime_type="application/pdf", resumable=False
+        )
+    except TypeError:
+        # Older SDKs only accept a filesystem path. A per-call temporary
+        # directory isolates concurrent sessions and guarantees cleanup even
+        # if the upload raises mid-way.
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_path = pathlib.Path(tmp_dir) / "upload.pdf"
+            tmp_path.write_bytes(pdf_bytes)
+            return genai.upload_file(str(tmp_path), mime_type="application/pdf")
+
+
+@retry_on_transient
+def _generate(model, content, stream: bool = False):
+    return model.generate_content(content, stream=stream)
+
+
+@retry_on_transient
+async def _generate_async(model, content):
+    return await model.generate_content_async(content)
+
+
+@st.cache_resource
+def init_genai():
+    """Load the API key and configure the Gemini client once per process."""
+    load_dotenv()
+    key = os.getenv("GOOGLE_API_KEY", st.secrets["API_KEY"] if "API_KEY" in st.secrets else None)
+    if key:
+        genai.configure(api_key=key)
+    return key
+
+
+# Deterministic generation keeps the exact-match response caches meaningful:
+# replaying a stored answer is only honest if a fresh call would agree with it.
+GENERATION_TEMPERATURE = 0.0
+
+
+@st.cache_resource
+def get_model(name: str, temperature: float = GENERATION_TEMPERATURE) -> genai.GenerativeModel:
+    """Build the model once per (name, temperature) and reuse it across
+    reruns and sessions."""
+    return genai.GenerativeModel(name, generation_config={"temperature": temperature})
+
+
+# Keep server-side files for a bounded window so repeat queries on the same
+# PDF skip the upload, then evict (LRU) and delete them to reclaim quota.
+UPLOAD_TTL_SECONDS = 60 * 60
+MAX_UPLOADED_FILES = 32
+
+
+@st.cache_resource
+def _upload_registry() -> OrderedDict:
+    """Process-wide LRU of (File handle, expiry) entries keyed by content hash."""
+    return OrderedDict()
+
+
+def _sha256_hex(data) -> str:
+    """SHA-256 hex digest of a bytes-like object.
+
+    hashlib.file_digest (3.11+) hashes through OpenSSL's zero-copy fileobj
+    path, which dispatches to SHA-NI/ARMv8 crypto instructions where the CPU
+    has them; older interpreters fall back to a plain incremental update.
+    """
+    if hasattr(hashlib, "file_digest"):
+        return hashlib.file_digest(io.BytesIO(data), "sha256").hexdigest()
+    hasher = hashlib.sha256()
+    hasher.update(data)
+    return hasher.hexdigest()
+
+
+def _delete_quietly(file_name: str) -> None:
+    """Delete a server-side file from a background thread.
+
+    Cleanup reclaims quota but must never add user-visible latency or surface
+    an error, so it is fire-and-forget.
+    """
+
+    def _bg():
+        try:
+            genai.delete_file(file_name)
+        except Exception:
+            pass
+
+    threading.Thread(target=_bg, daemon=True).start()
+
+
+class PdfProcessingError(RuntimeError):
+    """Raised when Gemini marks an uploaded file as FAILED."""
+
+
+def _wait_until_active(gemini_file):
+    """Poll an uploaded file until Gemini finishes processing it.
+
+    Exponential backoff with jitter (0.5s doubling to 8s) so short documents
+    are not taxed a full fixed interval and long ones do not cause a polling
+    storm. Raises rather than calling st.error/st.stop because uploads run on
+    worker threads without a ScriptRunContext; the main-thread call sites
+    render the message.
+    """
+    delay = 0.5
+    while gemini_file.state.name == "PROCESSING":
+        time.sleep(delay + random.uniform(0, 0.2))
+        delay = min(delay * 2, 8.0)
+        gemini_file = genai.get_file(gemini_file.name)
+    if gemini_file.state.name == "FAILED":
+        raise PdfProcessingError("Gemini could not process this PDF.")
+    return gemini_file
+
+
+def upload_once(pdf_hash: str, pdf_bytes: bytes):
+    """Reuse the server-side File for this content hash, uploading at most once
+    per TTL window. Expired or LRU-evicted handles are deleted Gemini-side."""
+    registry = _upload_registry()
+    now = time.time()
+    entry = registry.get(pdf_hash)
+    if entry is not None:
+        handle, expiry = entry
+        if expiry > now:
+            registry.move_to_end(pdf_hash)
+            return handle
+        registry.pop(pdf_hash, None)
+        _delete_quietly(handle.name)
+    handle = _wait_until_active(_upload(pdf_bytes))
+    registry[pdf_hash] = (handle, now + UPLOAD_TTL_SECONDS)
+    while len(registry) > MAX_UPLOADED_FILES:
+        _, (old_handle, _) = registry.popitem(last=False)
+        _delete_quietly(old_handle.name)
+    return handle
+
+
+@st.cache_data(ttl=24 * 60 * 60, show_spinner=False)
+def compress_pdf(pdf_bytes: bytes) -> bytes:
+    """Re-compress the PDF before upload to shrink scan-heavy papers.
+
+    Cached on the input bytes so repeated uploads skip the compression step.
+    Returns the original bytes when pikepdf is unavailable, the file is
+    malformed, or compression does not actually shrink it.
+    """
+    if pikepdf is None:
+        return pdf_bytes
+    try:
+        out = io.BytesIO()
+        with pikepdf.Pdf.open(io.BytesIO(pdf_bytes)) as pdf:
+            pdf.save(out, object_stream_mode=pikepdf.ObjectStreamMode.generate)
+        compressed = out.getvalue()
+    except Exception:
+        return pdf_bytes
+    return compressed if len(compressed) < len(pdf_bytes) else pdf_bytes
+
+
+def _buffered(stream, meta: dict | None = None, min_chars: int = 64):
+    """Yield streamed text in >=min_chars batches to cut render churn.
+
+    No artificial sleep between chunks — Streamlit batches renders itself, and
+    a per-chunk delay would add seconds of pure wall-clock time to long answers.
+    A stream can only be iterated once, so the last chunk is captured into
+    `meta` during this same pass for finish-reason inspection afterwards.
+    """
+    buf = []
+    size = 0
+    for chunk in stream:
+        if meta is not None:
+            meta["last"] = chunk
+        if not chunk.text:
+            continue
+        buf.append(chunk.text)
+        size += len(chunk.text)
+        if size >= min_chars:
+            yield "".join(buf)
+            buf, size = [], 0
+    if buf:
+        yield "".join(buf)
+
+
+def _warn_if_truncated(meta: dict) -> None:
+    """Surface an abnormal finish reason captured while streaming."""
+    last = meta.get("last")
+    if last is None or not last.candidates:
+        return
+    reason = last.candidates[0].finish_reason
+    if getattr(reason, "name", str(reason)) != "STOP" and reason != 1:
+        st.warning(f"Generation finished early: {reason}")
+
+
+_QUESTION_PATTERN = re.compile(r"\?|Q\s*\.?\s*\d|\b\d+\s*[.)]", re.IGNORECASE)
+
+
+def prefilter_pdf(pdf_bytes):
+    """Cheap local sanity check before paying any upload or token cost.
+
+    Returns (n_pages, problem) where problem is None for plausible papers.
+    Scanned PDFs with no extractable text are let through: they are the
+    common case here, and only Gemini's OCR can judge them.
+    """
+    try:
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        n_pages = len(reader.pages)
+    except Exception:
+        return 0, "This file could not be read as a PDF."
+    if n_pages == 0:
+        return 0, "This PDF has no pages."
+    text = "".join((page.extract_text() or "") for page in reader.pages[:3]).strip()
+    if len(text) >= 200 and not _QUESTION_PATTERN.search(text):
+        return n_pages, "This doesn't appear to be a question paper."
+    return n_pages, None
+
+
+def route_model(n_pages: int, force_pro: bool) -> str:
+    """Pick the model tier by input size: a short quiz does not need pro-tier
+    latency or cost, while a long paper benefits from the stronger model."""
+    if force_pro or n_pages > ROUTE_PAGES_THRESHOLD:
+        return ESCALATION_MODEL
+    return DEFAULT_MODEL
+
+
+def needs_escalation(text: str) -> bool:
+    """Cheap quality check: escalate when the answer is suspiciously short
+    or the model punted."""
+    lowered = text.lower()
+    return len(text.strip()) < MIN_ANSWER_CHARS or "i don't know" in lowered or "cannot answer" in lowered
+
+
+def _split_pdf(pdf_bytes: bytes) -> list:
+    """Split a PDF into ~CHUNK_PAGES-page sub-PDFs, or [pdf_bytes] if it is
+    already short (or unreadable, in which case Gemini gets the whole file)."""
+    try:
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        n_pages = len(reader.pages)
+    except Exception:
+        return [pdf_bytes]
+    if n_pages <= CHUNK_PAGES:
+        return [pdf_bytes]
+    chunks = []
+    for start in range(0, n_pages, CHUNK_PAGES):
+        writer = PdfWriter()
+        for page in reader.pages[start:start + CHUNK_PAGES]:
+            writer.add_page(page)
+        buf = io.BytesIO()
+        writer.write(buf)
+        # getbuffer() is a zero-copy view; getvalue() would duplicate each chunk.
+        chunks.append(buf.getbuffer())
+    return chunks
+
+
+async def solve_chunks(model, gemini_files, prompt):
+    """Solve each sub-PDF concurrently and return responses in page order."""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    async def one(gemini_file):
+        async with semaphore:
+            return await _generate_async(model, [gemini_file, prompt])
+
+    return await asyncio.gather(*(one(f) for f in gemini_files))
+
+
+async def upload_all(pdf_bytes_list):
+    """Upload several PDFs concurrently, reusing the per-hash upload cache."""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    async def one(pdf_bytes):
+        async with semaphore:
+            pdf_hash = _sha256_hex(pdf_bytes)
+            return await asyncio.to_thread(upload_once, pdf_hash, pdf_bytes)
+
+    return await asyncio.gather(*(one(b) for b in pdf_bytes_list))
+
+
+async def process_all(model, named_files, prompt):
+    """Generate an answer for each uploaded paper concurrently.
+
+    Wall time becomes roughly the latency of the slowest paper instead of the
+    sum; the semaphore keeps the burst under Gemini's request quota. Returns
+    (name, text) pairs in upload order.
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    async def one(name, gemini_file):
+        async with semaphore:
+            response = await _generate_async(model, [gemini_file, prompt])
+            return name, response.text
+
+    return await asyncio.gather(*(one(n, f) for n, f in named_files))
+
+
+async def run_all(model, gemini_file, prompts):
+    """Run several prompt variants against the same file concurrently.
+
+    N variants finish in roughly the latency of the slowest one instead of
+    their sum; the semaphore keeps us under Gemini's request quota.
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    async def one(prompt):
+        async with semaphore:
+            return await _generate_async(model, [gemini_file, prompt])
+
+    return await asyncio.gather(*(one(prompt) for prompt in prompts))
+
+
+api_key = init_genai()
+
+# Disk-backed exact-match cache: unlike st.cache_data's in-memory store, this
+# survives process restarts and redeploys. Entries expire after a day so the
+# database stays bounded.
+LLM_CACHE_PATH = pathlib.Path(".llm_cache.sqlite3")
+LLM_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+
+class LLMCache:
+    """SQLite cache of generated answers keyed by sha256(pdf_bytes + prompt)."""
+
+    def __init__(self, path: pathlib.Path = LLM_CACHE_PATH, ttl: int = LLM_CACHE_TTL_SECONDS):
+        self._ttl = ttl
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT, created_at INT)"
+        )
+        self._conn.execute(
+            "DELETE FROM responses WHERE created_at < ?", (int(time.time()) - ttl,)
+        )
+        self._conn.commit()
+
+    def get(self, key: str):
+        row = self._conn.execute(
+            "SELECT response FROM responses WHERE key = ? AND created_at >= ?",
+            (key, int(time.time()) - self._ttl),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, response: str) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+            (key, response, int(time.time())),
+        )
+        self._conn.commit()
+
+
+@st.cache_resource
+def get_llm_cache() -> LLMCache:
+    return LLMCache()
+
+
+# Semantic cache: near-duplicate PDFs (re-scans, minor OCR differences) miss the
+# exact-hash cache, so we also match on embedding similarity of the PDF text.
+SEMANTIC_CACHE_PATH = pathlib.Path(".semantic_cache.pkl")
+SIMILARITY_THRESHOLD = 0.95
+EMBEDDING_MODEL = "models/text-embedding-004"
+
+
+def _load_semantic_cache() -> dict:
+    if SEMANTIC_CACHE_PATH.exists():
+        with SEMANTIC_CACHE_PATH.open("rb") as f:
+            cache = pickle.load(f)
+        # Discard pre-task-aware cache files rather than risk cross-task hits.
+        if "tasks" in cache:
+            return cache
+    return {"embeddings": [], "answers": [], "tasks": []}
+
+
+def _save_semantic_cache(cache: dict) -> None:
+    with SEMANTIC_CACHE_PATH.open("wb") as f:
+        pickle.dump(cache, f)
+
+
+def _embed_pdf_text(pdf_bytes: bytes):
+    """Extract the PDF text locally and embed it, or None if there is no text."""
+    try:
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        text = "".join(page.extract_text() or "" for page in reader.pages)
+    except Exception:
+        return None
+    if not text.strip():
+        return None
+    result = genai.embed_content(model=EMBEDDING_MODEL, content=text[:8000])
+    embedding = np.asarray(result["embedding"], dtype=np.float32)
+    return embedding / np.linalg.norm(embedding)
+
+
+def semantic_lookup(embedding, task: str):
+    """Return a cached answer for this task whose embedding is close enough,
+    else None. Entries from other tasks never match: the same paper has very
+    different answers for "extract" and "solve"."""
+    cache = _load_semantic_cache()
+    indices = [i for i, t in enumerate(cache["tasks"]) if t == task]
+    if not indices:
+        return None
+    matrix = np.stack([cache["embeddings"][i] for i in indices])
+    similarities = matrix @ embedding
+    best = int(np.argmax(similarities))
+    if similarities[best] > SIMILARITY_THRESHOLD:
+        return cache["answers"][indices[best]]
+    return None
+
+
+def semantic_store(embedding, task: str, answer: str) -> None:
+    cache = _load_semantic_cache()
+    cache["embeddings"].append(embedding)
+    cache["answers"].append(answer)
+    cache["tasks"].append(task)
+    _save_semantic_cache(cache)
+
+
+def _response_key(pdf_bytes: bytes, prompt: str, model_name: str) -> str:
+    """Exact-match cache key for a generated answer.
+
+    The model name is part of the key so a pro-tier request never replays an
+    answer generated on the default tier. Feeds the hasher incrementally
+    rather than concatenating pdf_bytes with the prompt, which would allocate
+    a second PDF-sized buffer.
+    """
+    hasher = hashlib.sha256(pdf_bytes)
+    hasher.update(prompt.encode())
+    hasher.update(model_name.encode())
+    return hasher.hexdigest()
+
+
+@st.cache_data(ttl=24 * 60 * 60, show_spinner=False)
+def solve(pdf_bytes: bytes, task: str, model_name: str) -> str:
+    """Upload the PDF and generate a response, cached on (bytes, task, model).
+
+    The short task name stands in for the full prompt in the cache key, so
+    Streamlit's hasher never walks the long prompt text. Re-running with the
+    same PDF and task replays the stored answer without another Gemini round
+    trip; the answer is rendered from inside this function (streamed on a
+    miss, replayed on a hit).
+    """
+    prompt = PROMPTS[task]
+    llm_cache = get_llm_cache()
+    cache_key = _response_key(pdf_bytes, prompt, model_name)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        st.write(cached)
+        return cached
+    model = get_model(model_name)
+    chunks = _split_pdf(pdf_bytes)
+    if len(chunks) > 1:
+        embedding = _embed_pdf_text(pdf_bytes)
+        if embedding is not None:
+            cached = semantic_lookup(embedding, task)
+            if cached is not None:
+                st.write(cached)
+                return cached
+        with st.spinner(f"Processing your document ({len(chunks)} parts)..."):
+            try:
+                gemini_files = [
+                    upload_once(_sha256_hex(c), c) for c in chunks
+                ]
+            except PdfProcessingError as exc:
+                st.error(str(exc))
+                st.stop()
+            responses = asyncio.run(solve_chunks(model, gemini_files, prompt))
+        text = "\n\n".join(r.text for r in responses)
+        if model_name != ESCALATION_MODEL and needs_escalation(text):
+            with st.spinner(f"Retrying with {ESCALATION_MODEL}..."):
+                responses = asyncio.run(
+                    solve_chunks(get_model(ESCALATION_MODEL), gemini_files, prompt)
+                )
+            text = "\n\n".join(r.text for r in responses)
+        st.write(text)
+    else:
+        # The upload and the semantic-cache probe are independent network
+        # calls; overlap them instead of paying their sum. On the rare
+        # semantic hit the upload is spare work, but the registry keeps the
+        # handle for any follow-up task on the same paper.
+        with st.spinner("Processing your document..."):
+            pdf_hash = _sha256_hex(pdf_bytes)
+
+            async def _prepare():
+                return await asyncio.gather(
+                    asyncio.to_thread(upload_once, pdf_hash, pdf_bytes),
+                    asyncio.to_thread(_embed_pdf_text, pdf_bytes),
+                )
+
+            try:
+                gemini_file, embedding = asyncio.run(_prepare())
+            except PdfProcessingError as exc:
+                st.error(str(exc))
+                st.stop()
+        if embedding is not None:
+            cached = semantic_lookup(embedding, task)
+            if cached is not None:
+                st.write(cached)
+                return cached
+        meta = {}
+        stream = _generate(model, [gemini_file, prompt], stream=True)
+        text = st.write_stream(_buffered(stream, meta))
+        _warn_if_truncated(meta)
+        if model_name != ESCALATION_MODEL and needs_escalation(text):
+            st.info(f"Low-confidence answer, retrying with {ESCALATION_MODEL}...")
+            meta = {}
+            stream = _generate(get_model(ESCALATION_MODEL), [gemini_file, prompt], stream=True)
+            text = st.write_stream(_buffered(stream, meta))
+            _warn_if_truncated(meta)
+    llm_cache.set(cache_key, text)
+    if embedding is not None:
+        semantic_store(embedding, task, text)
+    return text
+
+
+if not api_key:
+    st.error("API Key not found. Please set it in environment variables or Streamlit secrets.")
+else:
+    st.title("DYNO AI Question Paper Solver")
+    st.write("Upload a PDF question paper, and the AI wextract text")
+
+    tasks = st.multiselect("Task", list(PROMPTS), default=["extract"])
+    force_pro = st.checkbox(
+        "Force high-quality model",
+        help="Always use the pro tier instead of routing by paper size.",
+    )
+    uploaded_files = st.file_uploader("Choose PDF files", type=["pdf"], accept_multiple_files=True)
+
+    if uploaded_files and tasks and len(uploaded_files) > 1:
+        # Batch mode: consult the session and disk caches per (file, task)
+        # and only upload/generate the misses, each paper with its own
+        # bounded-concurrency request per task, so the batch finishes in
+        # roughly the latency of the slowest uncached paper.
+        all_bytes = [compress_pdf(f.getvalue()) for f in uploaded_files]
+        checks = [prefilter_pdf(b) for b in all_bytes]
+        for f, (_, problem) in zip(uploaded_files, checks):
+            if problem:
+                st.warning(f"{f.name}: {problem}")
+        valid = [i for i, (_, problem) in enumerate(checks) if not problem]
+        if not valid:
+            st.stop()
+        # Route per file, same as the single-file path: a long paper in a
+        # batch deserves the pro tier even when its neighbours are short.
+        model_names = [route_model(n_pages, force_pro) for n_pages, _ in checks]
+        pdf_hashes = [_sha256_hex(b) for b in all_bytes]
+        answers = st.session_state.setdefault("answers", {})
+        llm_cache = get_llm_cache()
+        results = {}
+        misses = []
+        for task in tasks:
+            for i in valid:
+                pdf_bytes, pdf_hash = all_bytes[i], pdf_hashes[i]
+                run_key = f"{pdf_hash}:{task}:{model_names[i]}"
+                if run_key in answers:
+                    results[(task, i)] = answers[run_key]
+                    continue
+                cached = llm_cache.get(_response_key(pdf_bytes, PROMPTS[task], model_names[i]))
+                if cached is not None:
+                    answers[run_key] = cached
+                    results[(task, i)] = cached
+                else:
+                    misses.append((task, i))
+        if misses:
+            needed = sorted({i for _, i in misses})
+            with st.spinner(f"Uploading {len(needed)} documents..."):
+                try:
+                    handles = asyncio.run(upload_all([all_bytes[i] for i in needed]))
+                except PdfProcessingError as exc:
+                    st.error(str(exc))
+                    st.stop()
+            handle_by_index = dict(zip(needed, handles))
+            for task in tasks:
+                for tier in (DEFAULT_MODEL, ESCALATION_MODEL):
+                    tier_misses = [
+                        i for t, i in misses if t == task and model_names[i] == tier
+                    ]
+                    if not tier_misses:
+                        continue
+                    named_files = [
+                        (uploaded_files[i].name, handle_by_index[i]) for i in tier_misses
+                    ]
+                    with st.spinner(f"Processing {task}..."):
+                        generated = asyncio.run(
+                            process_all(get_model(tier), named_files, PROMPTS[task])
+                        )
+                    for i, (_, text) in zip(tier_misses, generated):
+                        results[(task, i)] = text
+                        answers[f"{pdf_hashes[i]}:{task}:{tier}"] = text
+                        llm_cache.set(_response_key(all_bytes[i], PROMPTS[task], tier), text)
+        for task in tasks:
+            for i in valid:
+                st.subheader(f"{uploaded_files[i].name} ({task}):")
+                st.write(results[(task, i)])
+    elif uploaded_files and tasks:
+        pdf_bytes = compress_pdf(uploaded_files[0].getvalue())
+        n_pages, problem = prefilter_pdf(pdf_bytes)
+        if problem:
+            st.warning(problem)
+            st.stop()
+        model_name = route_model(n_pages, force_pro)
+        if len(tasks) == 1:
+            st.subheader("AI-Generated Solution:")
+            # Short-circuit reruns triggered by unrelated widgets: any
+            # (file, task, model) already answered in this session replays
+            # from session state without re-entering the cache machinery.
+            run_key = f"{_sha256_hex(pdf_bytes)}:{tasks[0]}:{model_name}"
+            answers = st.session_state.setdefault("answers", {})
+            if run_key in answers:
+                st.write(answers[run_key])
+            else:
+                answers[run_key] = solve(pdf_bytes, tasks[0], model_name)
+        else:
+            # Same caches as the single-task path: replay answered tasks and
+            # only fire the concurrent calls for the missing ones.
+            pdf_hash = _sha256_hex(pdf_bytes)
+            answers = st.session_state.setdefault("answers", {})
+            llm_cache = get_llm_cache()
+            results = {}
+            pending = []
+            for task in tasks:
+                run_key = f"{pdf_hash}:{task}:{model_name}"
+                if run_key in answers:
+                    results[task] = answers[run_key]
+                    continue
+                cached = llm_cache.get(_response_key(pdf_bytes, PROMPTS[task], model_name))
+                if cached is not None:
+                    answers[run_key] = cached
+                    results[task] = cached
+                else:
+                    pending.append(task)
+            if pending:
+                with st.spinner("Processing your document..."):
+                    try:
+                        gemini_file = upload_once(pdf_hash, pdf_bytes)
+                    except PdfProcessingError as exc:
+                        st.error(str(exc))
+                        st.stop()
+                    responses = asyncio.run(
+                        run_all(get_model(model_name), gemini_file, [PROMPTS[t] for t in pending])
+                    )
+                for task, response in zip(pending, responses):
+                    results[task] = response.text
+                    answers[f"{pdf_hash}:{task}:{model_name}"] = response.text
+                    llm_cache.set(_response_key(pdf_bytes, PROMPTS[task], model_name), response.text)
+            for task in tasks:
+                st.subheader(f"AI-Generated Solution ({task}):")
+                st.write(results[task])